@@ -26,6 +26,7 @@ Options:
 
 import sys
 import os
+import shutil
 from pathlib import Path
 import csv
 import datetime
@@ -33,8 +34,13 @@ import glob
 import re
 import unicodedata
 from textwrap import dedent
+from functools import lru_cache
+from itertools import accumulate
+from collections import namedtuple
+from operator import itemgetter
 from configparser import ConfigParser, NoOptionError
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 
 __author__ = "HAYASHI Hideki"
@@ -52,6 +58,12 @@ CONFIGS = ["~/.config/csv2ofx/config", "~/csv2ofx.ini"]
 PARAMETERS = ["encoding", "timezone", "type", "cardnumber", "cardname",
               "skip", "head", "body"]
 DEFAULTS = dict(encoding="cp932", timezone="JST-9")
+DATEFORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%Y%m%d")
+
+MULTISPACE_RE = re.compile(r" +")
+HWKANA_DASH_RE = re.compile(r"([ｧ-ﾜ])-")  # hyphen as half-width long vowel
+KANA_MINUS_RE = re.compile(r"([ァ-ワぁ-わ])−")  # minus as long vowel
+CODING_RE = re.compile(rb"^[#;].*coding[:=]\s*([\w\-]+)", re.I)
 
 HEADER = """\
 OFXHEADER:100
@@ -95,17 +107,6 @@ NEWFILEUID:NONE
      <DTEND>{lastdate}
 """.replace("\r\n", "\n")
 
-TRANSACTION = """\
-     <STMTTRN>
-      <TRNTYPE>{transactiontype}
-      <DTPOSTED>{datetime}
-      <TRNAMT>{amount}
-      <FITID>{fitid}
-      <NAME>{description}
-      <MEMO>{memo}
-     </STMTTRN>
-""".replace("\r\n", "\n")
-
 FOOTER = """\
     </BANKTRANLIST>
     <LEDGERBAL>
@@ -122,10 +123,20 @@ if sys.version_info < (3, 8):
     raise RuntimeError("Python < 3.8 is not supported")
 
 
+@lru_cache(maxsize=4096)  # Merchant names and memos repeat across rows.
 def normalize(s):
-    s = re.sub(r"([ｧ-ﾜ])-", "\\1\uff70", s)
-    s = re.sub(r"([ァ-ワぁ-わ])−", "\\1\\u30fc", s)
-    return unicodedata.normalize("NFKC", s)
+    if s.isascii(): return s  # Nothing to do with ASCII, which is common.
+    s = HWKANA_DASH_RE.sub("\\1\uff70", s)
+    s = unicodedata.normalize("NFKC", s)
+    # After NFKC so that half-width kana followed by minus are caught too,
+    # which keeps normalize() idempotent.
+    return KANA_MINUS_RE.sub("\\1\u30fc", s)
+
+
+@lru_cache(maxsize=None)
+def charwidth(c):
+    """Get the display width of a character; 2 for East Asian wide ones."""
+    return (1, 2)[unicodedata.east_asian_width(c) in "FWA"]
 
 
 def parse_fielddef(cols):
@@ -155,6 +166,39 @@ def parse_fielddef(cols):
     return dic
 
 
+_DATE_CACHE = dict()
+
+
+def strpdate(s):
+    """Parse a date string in one of DATEFORMATS.
+
+    Zero-padded dates, the usual case, are told apart by their length and
+    separator and handed to the C-level datetime.fromisoformat() or sliced
+    into integers directly; anything else e.g. '2024/1/5' is left to
+    strptime().
+
+    Returns
+    -------
+    datetime.datetime
+        naive datetime
+    """
+    try:
+        if len(s) == 10 and s[4] == s[7] == "-":
+            return datetime.datetime.fromisoformat(s)
+        if len(s) == 10 and s[4] == s[7] == "/":
+            return datetime.datetime.fromisoformat(s.replace("/", "-"))
+        if len(s) == 8 and s.isascii() and s.isdigit():  # YYYYmmdd
+            return datetime.datetime(int(s[:4]), int(s[4:6]), int(s[6:]))
+    except ValueError:
+        pass
+    for fmt in DATEFORMATS:
+        try:
+            return datetime.datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    raise ValueError("illegal date format:" + s)
+
+
 def parse_date(s, tzinfo=None):
     """Parse a date string.
 
@@ -168,22 +212,20 @@ def parse_date(s, tzinfo=None):
         date and time with tzinfo as the timezone information
 
     If tzinfo=None, a naive (timezone-less) datetime.dateme is returned.
+    Parsed dates are cached by the date string and tzinfo, since
+    statements tend to repeat the same dates over and over.
     """
     if isinstance(s, (datetime.date, datetime.datetime)):
         return s
     if not isinstance(s, str):
         return None
-    dt = None
-    for fmt in ("%Y/%m/%d", "%Y-%m-%d", "%Y%m%d"):
-        try:
-            dt = datetime.datetime.strptime(s, fmt)
-            break
-        except ValueError:
-            pass
-    else:
-        raise ValueError("illegal date format:" + s)
-    if tzinfo:
-        dt = dt.replace(tzinfo=tzinfo)
+    dt = _DATE_CACHE.get((s, tzinfo))
+    if dt is None:
+        dt = strpdate(s)
+        if tzinfo:
+            dt = dt.replace(tzinfo=tzinfo)
+        if 4096 <= len(_DATE_CACHE): _DATE_CACHE.clear()
+        _DATE_CACHE[s, tzinfo] = dt
     return dt
 
 
@@ -215,7 +257,14 @@ class Timezone(datetime.tzinfo):
 
 class Transaction(object):
 
-    """A transaction record."""
+    """A transaction record.
+
+    Journal.read_csv() stores description and memo already normalized
+    by normalize(), so they can be written out as they are.
+    """
+
+    __slots__ = ("date", "description", "amount", "category", "tags", "memo",
+                 "account", "status", "tzinfo", "fitid")
 
     def __init__(self,
             date=datetime.date.today(),
@@ -227,6 +276,7 @@ class Transaction(object):
             account="unknown",
             status="-",  # "-", "C" (cleared) or "R" (reconciled)
             tzinfo=None,
+            fitid=None,
             ):
         self.date = date
         self.description = description
@@ -237,6 +287,7 @@ class Transaction(object):
         self.account = account
         self.status = status
         self.tzinfo = tzinfo
+        self.fitid = fitid
 
     def __repr__(self):
         return "Transaction(" + ":".join((
@@ -266,16 +317,29 @@ class Transaction(object):
 
 
 def detect_encoding(path):
-    """Detect the encoding of a text file."""
-    pat = re.compile(b"^#.*coding[:=]\s*([\w\-]+)", re.I)
+    """Detect the encoding of a text file.
+
+    Parameters
+    ----------
+    path : str
+        pathname of the source file
+
+    Returns
+    -------
+    str
+        'utf-8-sig' if the file begins with BOM, or the encoding specified
+        in the leading two lines e.g. '# coding: cp932', or 'utf-8'
+    """
     with open(path, "rb") as in_:
-        if in_.read(3) == UTF8BOM: return "utf-8-sig"
-        in_.seek(0)
-        mo = [pat.match(in_.readline()), pat.match(in_.readline())]
-    return ([m.group(1) for m in mo if m] or [b"utf-8"])[0].decode()
+        buf = in_.read(512)
+    if buf.startswith(UTF8BOM): return "utf-8-sig"
+    for line in buf.split(b"\n", 2)[:2]:
+        mo = CODING_RE.match(line)
+        if mo: return mo.group(1).decode()
+    return "utf-8"
 
 
-class Journal(set):
+class Journal(list):
 
     """A journal i.e. collection of transactions."""
 
@@ -291,11 +355,33 @@ class Journal(set):
         -------
         str
         """
+        # Format fields directly; strftime() is much slower for this.
+        s = (f"{dt.year:04d}{dt.month:02d}{dt.day:02d}"
+             f"{dt.hour:02d}{dt.minute:02d}{dt.second:02d}")
         if not dt.tzinfo:  # naive localtime
-            return dt.strftime("%Y%m%d%H%M%S")
-        return dt.strftime("%Y%m%d%H%M%S[{gmtoffset:+.2f}:{tzname}]").format(
-                gmtoffset=dt.tzinfo.utcoffset().seconds / 3600.0,
-                tzname=dt.tzname())
+            return s
+        gmtoffset = dt.utcoffset().total_seconds() / 3600
+        return f"{s}[{gmtoffset:+.2f}:{dt.tzname()}]"
+
+    @staticmethod
+    def ofxtransaction(trntype, dtposted, trnamt, fitid, name, memo):
+        """Build a STMTTRN aggregate of OFX.
+
+        Parameters are named after the OFX elements.  An f-string is used
+        rather than a template, as this is called for every transaction.
+
+        Returns
+        -------
+        str
+        """
+        return (f"     <STMTTRN>\n"
+                f"      <TRNTYPE>{trntype}\n"
+                f"      <DTPOSTED>{dtposted}\n"
+                f"      <TRNAMT>{trnamt}\n"
+                f"      <FITID>{fitid}\n"
+                f"      <NAME>{name}\n"
+                f"      <MEMO>{memo}\n"
+                f"     </STMTTRN>\n")
 
     def read_csv(self,
             pathname,
@@ -328,10 +414,11 @@ class Journal(set):
             (int) header lines to skip
             (bool) read card number/name from the header
         skip : int | None
-        fields : str
+        fields : str | dict
             comma-separated field names;
             a sequence of 'date', 'amount', 'description', 'memo', 'commission';
-            '+amount' and '-amount', and 'date?' are also available
+            '+amount' and '-amount', and 'date?' are also available;
+            or the dict parse_fielddef() built from them
         encoding : str
             encoding of the source CSV file
         tzinfo : datetime.tzinfo
@@ -352,6 +439,7 @@ class Journal(set):
         if amazon:
             az = AmazonJournal()
             az.read_csv(amazon)
+        substpat = None
         if subst:
             enc = detect_encoding(subst)
             # Setup the memo substitution table.
@@ -361,10 +449,53 @@ class Journal(set):
                     if line.startswith("#"): continue
                     if "=" not in line: continue
                     k, v = line.strip().split("=", 1)
-                    substdic[k] = v
-        fields = parse_fielddef(fields)
-        datefield = [f for f in fields if f in ("date", "date?")][0]
-        with open(pathname, "r", encoding=encoding) as f:
+                    # Store in the same form as memo, which is squeezed.
+                    k = MULTISPACE_RE.sub(" ", normalize(k))
+                    if k: substdic[k] = MULTISPACE_RE.sub(" ", normalize(v))
+            # Match all keys in a single pass; longer keys take priority.
+            if substdic:
+                substpat = re.compile("|".join(map(re.escape,
+                        sorted(substdic, key=len, reverse=True))))
+                substrepl = lambda mo: substdic[mo.group(0)]
+        if isinstance(fields, str):
+            fields = parse_fielddef(fields)
+        # Resolve field positions once; they are the same for every row.
+        optional_date = "date?" in fields
+        date_idx = fields["date?" if optional_date else "date"]
+        desc_idx = fields["description"]
+        memo_idx = fields.get("memo")
+        amount_idx = fields.get("amount")
+        plus_idx = fields.get("+amount")
+        minus_idx = fields.get("-amount")
+        comm_idx = fields.get("commission")
+        def toint(s):
+            if not s.isascii():  # e.g. full-width digits
+                s = unicodedata.normalize("NFKC", s)
+            return int(s.replace(",", "") or "0")
+        # Choose how to get the amount and memo once, not for every row.
+        if plus_idx is not None and minus_idx is not None:
+            def getamount(line):
+                return abs(toint(line[plus_idx])) - abs(toint(line[minus_idx]))
+        elif amount_idx is not None:
+            sign = -1 if accounttype == "credit" else 1
+            def getamount(line):
+                return sign * toint(line[amount_idx])
+        else:
+            assert accounttype == "credit"
+            def getamount(line):
+                return toint(line[minus_idx])
+        if memo_idx is None:
+            def getmemo(line):
+                return ""
+        elif isinstance(memo_idx, list):
+            def getmemo(line):
+                return normalize(",".join(
+                        line[col] for col in memo_idx if line[col]))
+        else:
+            def getmemo(line):
+                return normalize(line[memo_idx])
+        with open(pathname, "r", encoding=encoding, newline="",
+                  buffering=1 << 20) as f:
             reader = csv.reader(f)
             # Read CSV header.
             if skip:
@@ -379,42 +510,25 @@ class Journal(set):
             elif header is not None:  # ''
                 next(reader)  # Skip 1 line.
             # Read transactions.
-            prev_date = datetime.datetime(2000, 1, 1)
-            def c(f, defval=None):
-                if f.endswith("?"):
-                    return normalize(line[fields[f.rstrip("?")]]) or defval
-                return normalize(line[fields[f]])
-            def n(f):
-                return int(normalize(c(f)).replace(",", "") or "0")
+            prev_date = datetime.datetime(2000, 1, 1, tzinfo=tzinfo)
+            # Bind names used for every row to locals for faster lookup.
+            norm, parse, squeeze = normalize, parse_date, MULTISPACE_RE.sub
+            debug = logging.debug
             for i, line in enumerate(reader):
-                logging.debug(f">>> {line}")
+                debug(">>> %s", line)
                 t = Transaction()
+                date = norm(line[date_idx])
+                if optional_date and not date:
+                    date = prev_date
                 try:
-                    t.date = parse_date(c(datefield, defval=prev_date))
+                    t.date = parse(date, tzinfo)
                 except ValueError:
                     continue
-                t.date.replace(tzinfo=tzinfo)
-                t.description = c("description")
-                try:
-                    t.amount = abs(n("+amount")) - abs(n("-amount"))
-                except KeyError:
-                    try:
-                        t.amount = n("amount")
-                        if accounttype == "credit":
-                            t.amount *= -1
-                    except KeyError:
-                        t.amount = n("-amount")
-                        assert accounttype == "credit"
-                if "memo" in fields:
-                    if isinstance(fields["memo"], (list, tuple)):
-                        t.memo = ",".join(line[col] for col in fields["memo"]
-                                                            if line[col])
-                    else:
-                        t.memo = c("memo")
-                else:
-                    t.memo = ""
-                t.description = re.sub(" +", " ", t.description)
-                t.memo = re.sub(" +", " ", t.memo)
+                t.description = norm(line[desc_idx])
+                t.amount = getamount(line)
+                t.memo = getmemo(line)
+                t.description = squeeze(" ", t.description)
+                t.memo = squeeze(" ", t.memo)
                 if amazon and t.description == "AMAZON.CO.JP":
                     txns = az.search(date=t.date.date(), amount=-t.amount)
                     if len(txns) != 1:
@@ -423,23 +537,22 @@ class Journal(set):
                             "for date={}, amount={}\n".format(
                                 t.date.date(), -t.amount))
                     else:
-                        t.memo = txns[0][1]
+                        t.memo = norm(txns[0][1])
                 # Fix memo using the user-defined substitution table.
-                if subst:
-                    for k, v in substdic.items():
-                        t.memo.replace(k, v)
+                if substpat:
+                    t.memo = substpat.sub(substrepl, t.memo)
                 # Remove duplicate description from memo.
                 dlen = len(t.description)
-                if (t.memo[:dlen] == t.description and
-                        t.memo[dlen:].startswith(",")):
+                if (t.memo.startswith(t.description) and
+                        t.memo.startswith(",", dlen)):
                     t.memo = t.memo[dlen + 1:]
-                if "commission" in fields:
+                if comm_idx is not None:
                     if not t.description or t.description.startswith(REFMARK):
                         continue
                     if not t.amount:
-                        t.amount = - n("commission")
+                        t.amount = - toint(line[comm_idx])
                 t.fitid = i  # to overcome buggy OFX's
-                self.add(t)
+                self.append(t)
                 prev_date = t.date
             self.cardnumber = cardnumber
             self.cardname = cardname
@@ -455,10 +568,12 @@ class Journal(set):
             location to write transactions out
         upper : bool
             coerce description to uppercase
-        start_date : datetime.date | '' | None
-            write out transactions on or after this date
-        end_date : datetime.date | '' | None
-            write out transactions on or before this date
+        start_date : datetime.datetime | datetime.date | str | None
+            write out transactions on or after this date;
+            naive ones are taken as in the journal's timezone
+        end_date : datetime.datetime | datetime.date | str | None
+            write out transactions on or before this date;
+            naive ones are taken as in the journal's timezone
 
         Returns
         -------
@@ -466,39 +581,62 @@ class Journal(set):
 
         Notes
         -----
-        No file will be created if no transactions are recorded.
+        No file will be created if no transactions are recorded, or none
+        of them falls in the period.
         """
         if len(self) < 1: return
+        # Compare dates in the timezone transactions were read in.
+        tzinfo = self.datetime.tzinfo
+        def localize(d):
+            d = parse_date(d, tzinfo)
+            if not isinstance(d, datetime.datetime):
+                d = datetime.datetime.combine(d, datetime.time())
+            if d.tzinfo is None: d = d.replace(tzinfo=tzinfo)
+            return d
         if start_date:
-            start_date = parse_date(start_date)
+            start_date = localize(start_date)
         if end_date:
-            end_date = parse_date(end_date)
+            end_date = localize(end_date)
         def in_period(d):
             return ((not start_date or start_date <= d)
                     and (not end_date or d <= end_date))
         xcase = lambda s: s.upper() if upper else s
-        # Build OFX data.
+        # Select transactions to write out, in the order read i.e. by fitid.
         subset = [t for t in self if t.amount and in_period(t.date)]
-        subset.sort(key=lambda t: t.fitid)
-        result = [HEADER.format(
-                datetime=self.ofxdatetime(self.datetime),
-                cardname=self.cardname,
-                cardnumber=self.cardnumber,
-                firstdate=self.ofxdatetime(min(t.date for t in subset)),
-                lastdate=self.ofxdatetime(max(t.date for t in subset)),
-                )]
-        result.extend(TRANSACTION.format(
-                transactiontype="CREDIT" if 0 <= t.amount else "DEBIT",
-                datetime=self.ofxdatetime(t.date),
-                amount=abs(t.amount),
-                fitid=t.fitid,
-                description=xcase(normalize(t.description)),
-                memo=normalize(t.memo),
-                ) for t in subset)
-        result.append(FOOTER.format(
-                totalamount=sum(t.amount for t in subset)))
-        with open(pathname, "w", encoding="utf-8") as f:
-            f.writelines(result)
+        if not subset: return
+        # Find the period and the balance in a single pass.
+        firstdate = lastdate = subset[0].date
+        totalamount = 0
+        for t in subset:
+            if t.date < firstdate:
+                firstdate = t.date
+            elif lastdate < t.date:
+                lastdate = t.date
+            totalamount += t.amount
+        # Write OFX data out as it is built.
+        with open(pathname, "w", encoding="utf-8", buffering=1 << 20) as f:
+            f.write(HEADER.format(
+                    datetime=self.ofxdatetime(self.datetime),
+                    cardname=self.cardname,
+                    cardnumber=self.cardnumber,
+                    firstdate=self.ofxdatetime(firstdate),
+                    lastdate=self.ofxdatetime(lastdate),
+                    ))
+            for t in subset:
+                f.write(self.ofxtransaction(
+                        "CREDIT" if 0 <= t.amount else "DEBIT",
+                        self.ofxdatetime(t.date),
+                        abs(t.amount),
+                        t.fitid,
+                        xcase(t.description),
+                        t.memo))
+            f.write(FOOTER.format(totalamount=totalamount))
+
+
+# Columns in use of the Amazon.co.jp order history.
+AmazonRow = namedtuple("AmazonRow", [
+        "注文番号", "注文日", "商品名", "付帯情報", "価格", "個数", "商品小計",
+        "クレカ請求日", "クレカ請求額", "クレカ種類"])
 
 
 class AmazonOrderItem(dict):
@@ -506,16 +644,16 @@ class AmazonOrderItem(dict):
     """Single item with name, unit price, quantity, etc."""
 
     def __init__(self, row):
-        name = row["商品名"]
-        description = row["付帯情報"].replace("　", " ").split(" ", 1)[0]
+        name = row.商品名
+        description = row.付帯情報.replace("　", " ").split(" ", 1)[0]
         self.update(dict(
-            orderid = row["注文番号"],
-            name = row["商品名"],
-            description = row["付帯情報"],
-            price = row["価格"],
-            quantity = row["個数"],
+            orderid = row.注文番号,
+            name = row.商品名,
+            description = row.付帯情報,
+            price = row.価格,
+            quantity = row.個数,
             # Following data will NOT be fed for あわせ買い対象商品
-            amount = row["商品小計"],  # = price * quantity
+            amount = row.商品小計,  # = price * quantity
             ))
 
     def __str__(self):
@@ -532,28 +670,36 @@ class AmazonOrderBatch(list):
 
     def __init__(self, row):
         self.append([AmazonOrderItem(row)])
+        self._omitted = None
 
     def add(self, row):
         self[-1].append(AmazonOrderItem(row))
+        self._omitted = None
 
     @staticmethod
     def omit(s, width=40):
-        def charwidth(c):
-            return (1, 2)[unicodedata.east_asian_width(c) in "FWA"]
         cw = list(map(charwidth, normalize(s).replace("　", " ")))
-        if sum(cw) <= width: return s
+        # Use prefix sums rather than summing up slices over and over.
+        acc = list(accumulate(cw, initial=0))  # acc[k] == sum(cw[:k])
+        n, total = len(cw), acc[-1]
+        if total <= width: return s
+        def headwidth(h): return acc[min(h, n)]
+        def tailwidth(t): return total - acc[max(n + t, 0)]
         t = -1
         maxlen = int((width - 2) / 2)
-        while sum(cw[t - 1:]) <= maxlen: t -= 1
+        while tailwidth(t - 1) <= maxlen: t -= 1
         h = 1
-        maxlen = width - sum(cw[t:]) - 2
-        while sum(cw[:h + 1]) <= maxlen: h += 1
-        return s[:h] + "." * (width - sum(cw[:h]) - sum(cw[t:])) + s[t:]
+        maxlen = width - tailwidth(t) - 2
+        while headwidth(h + 1) <= maxlen: h += 1
+        return s[:h] + "." * (width - headwidth(h) - tailwidth(t)) + s[t:]
 
 
     def omitted(self):
-        return ";".join(",".join(self.omit(item["name"]) for item in itemset)
-                        for itemset in self)
+        if self._omitted is None:
+            self._omitted = ";".join(
+                    ",".join(self.omit(item["name"]) for item in itemset)
+                    for itemset in self)
+        return self._omitted
 
     def __str__(self):
         return ";".join(",".join(item["name"] for item in itemset)
@@ -573,13 +719,13 @@ class AmazonOrder(list):
 
     @staticmethod
     def ccc(row):
-        return (row["クレカ請求日"], row["クレカ請求額"], row["クレカ種類"])
+        return (row.クレカ請求日, row.クレカ請求額, row.クレカ種類)
 
     def add_charge(self, row):
         self.charges.append(self.ccc(row))
 
     def add_row(self, row):
-        name = row["商品名"]
+        name = row.商品名
         if name in ("（注文全体）", "（割引）", "（配送料・手数料）",
                     "（Amazonポイント）"):
             return
@@ -589,12 +735,12 @@ class AmazonOrder(list):
                 self.charges.remove(ccc)
             self.add_charge(row)
             return
-        if row["クレカ請求額"]:  # Only for digitally sold items.
-            row["クレカ請求日"] = row["注文日"]
+        if row.クレカ請求額:  # Only for digitally sold items.
+            row = row._replace(クレカ請求日=row.注文日)
             self.append(AmazonOrderBatch(row))
             self.add_charge(row)
             return
-        if row["商品小計"] != "":
+        if row.商品小計 != "":
             self.append(AmazonOrderBatch(row))
         else:  # Add-on items.
             self[-1].add(row)
@@ -607,53 +753,58 @@ class AmazonOrder(list):
 
 class AmazonJournal(dict):
 
+    def __init__(self):
+        super().__init__()
+        self.bycharge = dict()  # (charge date, amount) -> [(order, index)]
+
     def read_csv(self, pathname):
-        with open(pathname, "r", encoding="utf-8-sig") as in_:
-            reader = csv.DictReader(in_)
-            for row in reader:
-                order_id = row["注文番号"]
+        with open(pathname, "r", encoding="utf-8-sig", newline="",
+                  buffering=1 << 20) as in_:
+            reader = csv.reader(in_)
+            header = next(reader, None)
+            if not header: return
+            missing = [k for k in AmazonRow._fields if k not in header]
+            if missing:
+                raise ValueError("missing column(s) in {}: {}".format(
+                        pathname, ", ".join(missing)))
+            # Pick up the columns in use rather than build a dict per row.
+            pick = itemgetter(*map(header.index, AmazonRow._fields))
+            width = len(header)
+            for line in reader:
+                if not line: continue
+                if len(line) < width:  # Pad short rows as DictReader did.
+                    line += [""] * (width - len(line))
+                row = AmazonRow._make(pick(line))
+                order_id = row.注文番号
                 if order_id not in self:
                     self[order_id] = order = AmazonOrder(order_id)
                 order.add_row(row)
+        self.index()
+
+    def index(self):
+        """Index card charges by date and amount to speed up search()."""
+        self.bycharge.clear()
+        for order in self.values():
+            for i, charge in enumerate(order.charges):
+                key = (parse_date(charge[0]).date(), int(charge[1]))
+                self.bycharge.setdefault(key, []).append((order, i))
 
     def search(self, date=None, amount=None):
         if date and not isinstance(date, (tuple, list)):
             date = (date - datetime.timedelta(days=1),
                     date + datetime.timedelta(days=2))
-        result = []
-        for order in self.values():
-            for i, charge in enumerate(order.charges):
-                chargedate = parse_date(charge[0]).date()
-                chargeamount = int(charge[1])
+        charges = []
+        if date is None or amount is None:
+            for (chargedate, chargeamount), cs in self.bycharge.items():
                 if ((date is None or date[0] <= chargedate <= date[1]) and
                         (amount is None or chargeamount == amount)):
-                    result.append((order.orderid, order[i].omitted()))
-        return result
-
-
-def getencoding(path):
-    """Detect encoding string from the leading two lines.
-
-    Parameters
-    ----------
-    path : str
-        pathname of the source file
-
-    Returns
-    -------
-    str | None
-        encoding specified in file
-    """
-    coding = re.compile(r"coding[:=]\s*(\w)+")
-    with open(path, encoding="ascii") as in_:
-        for _ in (0, 1):
-            try:
-                mo = coding.search(in_.readline())
-            except UnicodeDecodeError:
-                continue
-            if mo:
-                return mo.group(0)
-    return None
+                    charges.extend(cs)
+        else:  # Look up each day in the period; the usual case.
+            d = date[0]
+            while d <= date[1]:
+                charges.extend(self.bycharge.get((d, amount), ()))
+                d += datetime.timedelta(days=1)
+        return [(order.orderid, order[i].omitted()) for order, i in charges]
 
 
 def gettimezone(timezone):
@@ -700,12 +851,18 @@ def preprocess_btmucc(pathname):
         return
     origname = pathname + ".orig"
     os.rename(pathname, origname)
-    cr, lf, crlf = "\x0D", "\x0A", "\x0D\x0A"
-    with open(origname, "r", encoding="cp932", newline=crlf) as in_, \
-         open(pathname, "w", encoding="cp932") as out:
-        sublines = in_.readline().rstrip().split(cr)
-        out.write(sublines[-1] + crlf)
-        out.write(in_.read())
+    # Only the header needs fixing up; copy the rest as bytes.  The header
+    # line ends with CRLF but holds extra lines separated by bare CR's.
+    cr, crlf = "\x0D", b"\x0D\x0A"
+    with open(origname, "rb") as in_, open(pathname, "wb") as out:
+        header = in_.readline()
+        while header and not header.endswith(crlf):  # Bare LF's as well.
+            line = in_.readline()
+            if not line: break
+            header += line
+        sublines = header.decode("cp932").rstrip().split(cr)
+        out.write(sublines[-1].encode("cp932") + crlf)
+        shutil.copyfileobj(in_, out, 1 << 20)
 
 
 def getparams(conf: ConfigParser, issuer: str, baselist=None) -> dict:
@@ -740,11 +897,44 @@ def findconf(path: str) -> str:
     raise ValueError("no configuration file")
 
 
+def convert(in_: str, params: dict, tz=None, amazon=None, subst=None,
+            upper=False, start_date=None, end_date=None):
+    """Convert a CSV file into an OFX file of the same basename.
+
+    Parameters
+    ----------
+    in_ : str
+        pathname of the source CSV file
+    params : dict
+        issuer parameters built by getparams()
+    tz : str | None
+        timezone string e.g. 'JST-9'; not Timezone, to keep arguments
+        picklable for worker processes
+    amazon, subst, upper, start_date, end_date
+        see Journal.read_csv() and Journal.write_ofx()
+
+    Returns
+    -------
+    None
+    """
+    tzinfo = gettimezone(tz) if tz else None
+    journal = Journal()
+    def _(k): return params.get(k)
+    journal.read_csv(in_,
+            accounttype=_("type"),
+            cardnumber=_("cardnumber"), cardname=_("cardname"),
+            header=_("header"), skip=int(_("skip") or "0"),
+            fields=_("body"), encoding=_("encoding"),
+            tzinfo=tzinfo, amazon=amazon, subst=subst)
+    journal.write_ofx(in_[:-4] + ".ofx", upper=upper,
+            start_date=start_date, end_date=end_date)
+
+
 def main(args: dict):
     for k, v in args.items():
         setattr(args, k.lstrip("-").replace("-", "_"), v)
     args.conf = findconf(args.conf)
-    args.encoding = args.encoding or getencoding(args.conf) or "utf-8"
+    args.encoding = args.encoding or detect_encoding(args.conf)
     conf = ConfigParser()
     if args.encoding.lower().replace("_", "-") == "utf-8":
         args.encoding = "utf-8-sig"
@@ -756,30 +946,41 @@ def main(args: dict):
         raise ValueError(f"can't find issuer '{args.issuer}'")
     params = getparams(conf, args.issuer)
     for k, v in DEFAULTS.items(): params.setdefault(k, v)
+    if "body" not in params:
+        raise ValueError(f"no body defined for issuer '{args.issuer}'")
+    # Parse the field definition once for all files.
+    params["body"] = parse_fielddef(params["body"])
     tz = args.timezone or params.get("timezone")
-    tzinfo = gettimezone(tz) if tz else None
+    if tz: gettimezone(tz)  # Fail early on illegal timezone.
+    filelist = []
     for path in args.PATH:
         if "*" in path or "?" in path:
-            filelist = glob.glob(path)
+            paths = glob.glob(path)
         else:
-            filelist = [path]
-        for in_ in filelist:
+            paths = [path]
+        for in_ in paths:
             if not in_.lower().endswith(".csv"):
                 raise ValueError("only CSV files are acceptable")
             if args.issuer.lower() == "btmucc":
                 preprocess_btmucc(in_)
-            out = in_[:-4] + ".ofx"
-            journal = Journal()
-            def _(k): return params.get(k)
-            journal.read_csv(in_,
-                    accounttype=_("type"),
-                    cardnumber=_("cardnumber"), cardname=_("cardname"),
-                    header=_("header"), skip=int(_("skip") or "0"),
-                    fields=_("body"), encoding=_("encoding"),
-                    tzinfo=tzinfo, amazon=args.amazon, subst=args.subst)
-            journal.write_ofx(out, upper=args.upper,
-                    start_date=args["--start-date"],
-                    end_date=args["--end-date"])
+            filelist.append(in_)
+    options = dict(tz=tz, amazon=args.amazon, subst=args.subst,
+                   upper=args.upper, start_date=args["--start-date"],
+                   end_date=args["--end-date"])
+    if len(filelist) < 2:
+        for in_ in filelist:
+            convert(in_, params, **options)
+        return
+    # Files are independent of each other; convert them in parallel.
+    # Spawned workers do not inherit the logging setup; pass it on.
+    workers = min(len(filelist), os.cpu_count() or 1)
+    loglevel = logging.DEBUG if args.debug else args.loglevel
+    with ProcessPoolExecutor(max_workers=workers, initializer=setlogger,
+                             initargs=(args.logfile, loglevel)) as executor:
+        futures = [executor.submit(convert, in_, params, **options)
+                   for in_ in filelist]
+        for future in futures:
+            future.result()  # Propagate exceptions.
 
 
 def setlogger(filename=None, loglevel=logging.WARNING, force=False):